@@ -6,17 +6,20 @@ Cross-platform loader for position-independent code.
 Loads shellcode from a local file.
 
 Usage:
-    python loader.py --arch x86_64 output.bin
+    python loader.py --arch x86_64 [-v] output.bin
 """
 
 import argparse
 import ctypes
+import functools
 import mmap
 import os
 import platform
-import struct
 import sys
 
+if sys.platform == 'win32':
+    from ctypes import wintypes
+
 # =============================================================================
 # Architecture Definitions
 # =============================================================================
@@ -31,6 +34,16 @@ ARCH = {
     'mips64':  {'bits': 64, 'family': 'mips'},
 }
 
+# =============================================================================
+# Output
+# =============================================================================
+
+def _info(verbose, msg):
+    """Print an informational [*] line when verbose is set (-v/--verbose)."""
+    if verbose:
+        print("[*] " + msg)
+
+
 # =============================================================================
 # Host Detection
 # =============================================================================
@@ -45,12 +58,18 @@ _MACHINE_ALIASES = [
     (('mips64',),                   'mips',  64),
 ]
 
+_MACHINE_INDEX = {alias: (family, bits)
+                  for aliases, family, bits in _MACHINE_ALIASES
+                  for alias in aliases}
+
 
 def _detect_os():
     """Detect the OS, distinguishing iOS and Android from their parent kernels."""
     if sys.platform == 'ios':
         return 'ios'
-    os_name = platform.system().lower()
+    if sys.platform == 'win32':
+        return 'windows'
+    os_name = os.uname().sysname.lower()
     if os_name == 'linux':
         if 'ANDROID_ROOT' in os.environ:
             return 'android'
@@ -66,58 +85,100 @@ def _detect_os():
 
 
 def _detect_arch():
-    """Detect the CPU family and bitness from platform.machine()."""
-    machine = platform.machine().lower()
-    for aliases, family, bits in _MACHINE_ALIASES:
-        if machine in aliases:
-            return family, bits
+    """Detect the CPU family and bitness from the OS-reported machine name."""
+    if sys.platform == 'win32':
+        # platform asks WMI for the native CPU (3.12+), which the environment
+        # misreports for emulated x64 Python on ARM64
+        machine = platform.machine()
+    else:
+        machine = os.uname().machine
+    machine = machine.lower()
+    if machine in _MACHINE_INDEX:
+        return _MACHINE_INDEX[machine]
     # iOS devices report model identifiers (e.g. 'iphone14,7', 'ipad13,4')
     if machine.startswith(('iphone', 'ipad', 'ipod', 'appletv', 'watch')):
         return 'arm', 64
     return machine, 64
 
 
+@functools.lru_cache(maxsize=None)
 def get_host():
-    """Returns (os_name, family, bits) for the current host."""
+    """Returns (os_name, family, bits) for the current host (detected once)."""
     family, bits = _detect_arch()
     return _detect_os(), family, bits
 
 
+# =============================================================================
+# Shellcode Loading
+# =============================================================================
+
+def _read_into(f, buf, size):
+    """Fill buf with size bytes from an unbuffered file."""
+    view = memoryview(buf).cast('B')
+    offset = 0
+    while offset < size:
+        n = f.readinto(view[offset:])
+        if not n:
+            raise OSError("Short read: %d of %d bytes" % (offset, size))
+        offset += n
+
+
+def _shellcode_size(f, path):
+    """Return the size of an open shellcode file, rejecting empty files."""
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        raise OSError("Empty shellcode file: %s" % path)
+    return size
+
+
+def load_shellcode(path):
+    """Map shellcode copy-on-write and return a ctypes view over the mapping."""
+    # ctypes can only view writable buffers, hence ACCESS_COPY over ACCESS_READ;
+    # nothing writes to the view, so the pages stay shared with the file cache.
+    with open(path, 'rb') as f:
+        _shellcode_size(f, path)
+        mem = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return (ctypes.c_ubyte * len(mem)).from_buffer(mem)
+
+
 # =============================================================================
 # Execution — POSIX (mmap + mprotect)
 # =============================================================================
 
 def _flush_icache(addr, size):
     """Flush instruction cache on ARM64 Darwin (macOS/iOS)."""
-    machine = platform.machine().lower()
-    if machine not in ('arm64', 'aarch64'):
+    host_os, family, bits = get_host()
+    if (family, bits) != ('arm', 64):
         return
-    os_name = platform.system().lower()
-    if os_name == 'darwin' or sys.platform == 'ios':
+    if host_os in ('darwin', 'ios'):
         libc = ctypes.CDLL(None)
         libc.sys_icache_invalidate.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
         libc.sys_icache_invalidate.restype = None
         libc.sys_icache_invalidate(ctypes.c_void_p(addr), ctypes.c_size_t(size))
 
 
-def run_mmap(shellcode):
-    """Map shellcode RW, flip to RX via mprotect, execute."""
-    mem = mmap.mmap(-1, len(shellcode), prot=mmap.PROT_READ | mmap.PROT_WRITE)
-    mem.write(shellcode)
-    addr = ctypes.addressof(ctypes.c_char.from_buffer(mem))
+def run_mmap(path, *, verbose=False):
+    """Read shellcode straight into an RW mapping, flip to RX via mprotect, execute."""
+    with open(path, 'rb', buffering=0) as f:
+        size = _shellcode_size(f, path)
+        mem = mmap.mmap(-1, size, prot=mmap.PROT_READ | mmap.PROT_WRITE)
+        buf = (ctypes.c_ubyte * size).from_buffer(mem)
+        _read_into(f, buf, size)
+    print("[+] Loaded: %d bytes" % size)
+    addr = ctypes.addressof(buf)
 
     libc = ctypes.CDLL(None)
     page_size = os.sysconf('SC_PAGE_SIZE')
     aligned = addr & ~(page_size - 1)
-    total = len(shellcode) + (addr - aligned)
+    total = size + (addr - aligned)
     if libc.mprotect(ctypes.c_void_p(aligned), ctypes.c_size_t(total),
                      mmap.PROT_READ | mmap.PROT_EXEC) != 0:
         raise OSError("mprotect failed")
 
-    _flush_icache(addr, len(shellcode))
+    _flush_icache(addr, size)
 
     print("[+] Entry: 0x%x" % addr)
-    print("[*] Executing...")
+    _info(verbose, "Executing...")
     sys.stdout.flush()
     return ctypes.CFUNCTYPE(ctypes.c_int)(addr)()
 
@@ -132,6 +193,8 @@ CREATE_SUSPENDED                   = 0x00000004
 EXTENDED_STARTUPINFO_PRESENT       = 0x00080000
 INFINITE                           = 0xFFFFFFFF
 PROC_THREAD_ATTRIBUTE_MACHINE_TYPE = 0x00020019
+ERROR_FILE_NOT_FOUND               = 2
+ERROR_PATH_NOT_FOUND               = 3
 
 MACHINE_TYPE = {
     'i386':    0x014c,  # IMAGE_FILE_MACHINE_I386
@@ -148,70 +211,7 @@ HOST_PROCESS = {
 }
 
 
-def setup_kernel32():
-    from ctypes import wintypes
-    k32 = ctypes.windll.kernel32
-
-    k32.VirtualAllocEx.argtypes = [wintypes.HANDLE, wintypes.LPVOID, ctypes.c_size_t, wintypes.DWORD, wintypes.DWORD]
-    k32.VirtualAllocEx.restype = wintypes.LPVOID
-
-    k32.WriteProcessMemory.argtypes = [wintypes.HANDLE, wintypes.LPVOID, wintypes.LPCVOID, ctypes.c_size_t, ctypes.POINTER(ctypes.c_size_t)]
-    k32.WriteProcessMemory.restype = wintypes.BOOL
-
-    k32.CreateRemoteThread.argtypes = [wintypes.HANDLE, wintypes.LPVOID, ctypes.c_size_t, wintypes.LPVOID, wintypes.LPVOID, wintypes.DWORD, wintypes.LPVOID]
-    k32.CreateRemoteThread.restype = wintypes.HANDLE
-
-    k32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
-    k32.WaitForSingleObject.restype = wintypes.DWORD
-
-    k32.GetExitCodeThread.argtypes = [wintypes.HANDLE, wintypes.LPDWORD]
-    k32.GetExitCodeThread.restype = wintypes.BOOL
-
-    k32.CloseHandle.argtypes = [wintypes.HANDLE]
-    k32.CloseHandle.restype = wintypes.BOOL
-
-    k32.TerminateProcess.argtypes = [wintypes.HANDLE, wintypes.UINT]
-    k32.TerminateProcess.restype = wintypes.BOOL
-
-    k32.GetLastError.argtypes = []
-    k32.GetLastError.restype = wintypes.DWORD
-
-    k32.CreateProcessW.argtypes = [
-        wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.LPVOID, wintypes.LPVOID,
-        wintypes.BOOL, wintypes.DWORD, wintypes.LPVOID, wintypes.LPCWSTR,
-        wintypes.LPVOID, wintypes.LPVOID
-    ]
-    k32.CreateProcessW.restype = wintypes.BOOL
-
-    k32.InitializeProcThreadAttributeList.argtypes = [
-        ctypes.c_void_p, wintypes.DWORD, wintypes.DWORD, ctypes.POINTER(ctypes.c_size_t)
-    ]
-    k32.InitializeProcThreadAttributeList.restype = wintypes.BOOL
-
-    k32.UpdateProcThreadAttribute.argtypes = [
-        ctypes.c_void_p, wintypes.DWORD, ctypes.c_size_t,
-        ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p, ctypes.c_void_p
-    ]
-    k32.UpdateProcThreadAttribute.restype = wintypes.BOOL
-
-    k32.DeleteProcThreadAttributeList.argtypes = [ctypes.c_void_p]
-    k32.DeleteProcThreadAttributeList.restype = None
-
-    return k32
-
-
-def run_injected(shellcode, target_arch, cross_family=False):
-    """Run shellcode via suspended-process injection (Windows only)."""
-    from ctypes import wintypes
-
-    host_exe = HOST_PROCESS.get(target_arch)
-    if not host_exe or not os.path.exists(host_exe):
-        raise OSError("No suitable host process for %s" % target_arch)
-
-    print("[+] Host process: %s" % host_exe)
-
-    k32 = setup_kernel32()
-
+if sys.platform == 'win32':
     class STARTUPINFOW(ctypes.Structure):
         _fields_ = [
             ("cb", wintypes.DWORD), ("lpReserved", wintypes.LPWSTR),
@@ -238,6 +238,63 @@ def run_injected(shellcode, target_arch, cross_family=False):
             ("dwProcessId", wintypes.DWORD), ("dwThreadId", wintypes.DWORD),
         ]
 
+    # (name, argtypes, restype) for every kernel32 function the loader calls
+    _K32_PROTOTYPES = [
+        ('VirtualAllocEx',
+         [wintypes.HANDLE, wintypes.LPVOID, ctypes.c_size_t, wintypes.DWORD, wintypes.DWORD],
+         wintypes.LPVOID),
+        ('WriteProcessMemory',
+         [wintypes.HANDLE, wintypes.LPVOID, wintypes.LPCVOID, ctypes.c_size_t, ctypes.POINTER(ctypes.c_size_t)],
+         wintypes.BOOL),
+        ('CreateRemoteThread',
+         [wintypes.HANDLE, wintypes.LPVOID, ctypes.c_size_t, wintypes.LPVOID, wintypes.LPVOID, wintypes.DWORD, wintypes.LPVOID],
+         wintypes.HANDLE),
+        ('WaitForSingleObject', [wintypes.HANDLE, wintypes.DWORD], wintypes.DWORD),
+        ('GetExitCodeThread',   [wintypes.HANDLE, wintypes.LPDWORD], wintypes.BOOL),
+        ('CloseHandle',         [wintypes.HANDLE], wintypes.BOOL),
+        ('TerminateProcess',    [wintypes.HANDLE, wintypes.UINT], wintypes.BOOL),
+        ('CreateProcessW',
+         [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.LPVOID, wintypes.LPVOID,
+          wintypes.BOOL, wintypes.DWORD, wintypes.LPVOID, wintypes.LPCWSTR,
+          wintypes.LPVOID, wintypes.LPVOID],
+         wintypes.BOOL),
+        ('InitializeProcThreadAttributeList',
+         [ctypes.c_void_p, wintypes.DWORD, wintypes.DWORD, ctypes.POINTER(ctypes.c_size_t)],
+         wintypes.BOOL),
+        ('UpdateProcThreadAttribute',
+         [ctypes.c_void_p, wintypes.DWORD, ctypes.c_size_t,
+          ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p, ctypes.c_void_p],
+         wintypes.BOOL),
+        ('DeleteProcThreadAttributeList', [ctypes.c_void_p], None),
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def setup_kernel32():
+    """Bind kernel32 prototypes on first use; later calls return the cached handle."""
+    k32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    for name, argtypes, restype in _K32_PROTOTYPES:
+        fn = getattr(k32, name)
+        fn.argtypes = argtypes
+        fn.restype = restype
+    return k32
+
+
+def run_injected(shellcode, target_arch, cross_family=False, *, verbose=False):
+    """Run shellcode via suspended-process injection (Windows only).
+
+    shellcode may be bytes or a ctypes array such as load_shellcode() returns;
+    both reach WriteProcessMemory by pointer without a copy, so callers running
+    many shots can reuse one buffer.
+    """
+    host_exe = HOST_PROCESS.get(target_arch)
+    if not host_exe:
+        raise OSError("No suitable host process for %s" % target_arch)
+
+    print("[+] Host process: %s" % host_exe)
+
+    k32 = setup_kernel32()
+
     pi = PROCESS_INFORMATION()
     creation_flags = CREATE_SUSPENDED
     attr_list_buf = None
@@ -250,56 +307,62 @@ def run_injected(shellcode, target_arch, cross_family=False):
 
         attr_list_buf = (ctypes.c_byte * size.value)()
         if not k32.InitializeProcThreadAttributeList(attr_list_buf, 1, 0, ctypes.byref(size)):
-            raise OSError("InitializeProcThreadAttributeList failed: %d" % k32.GetLastError())
+            raise OSError("InitializeProcThreadAttributeList failed: %d" % ctypes.get_last_error())
 
         if not k32.UpdateProcThreadAttribute(
             attr_list_buf, 0, PROC_THREAD_ATTRIBUTE_MACHINE_TYPE,
             ctypes.byref(machine), ctypes.sizeof(machine), None, None
         ):
+            err = ctypes.get_last_error()
             k32.DeleteProcThreadAttributeList(attr_list_buf)
-            raise OSError("UpdateProcThreadAttribute failed: %d" % k32.GetLastError())
+            raise OSError("UpdateProcThreadAttribute failed: %d" % err)
 
         siex = STARTUPINFOEXW()
         siex.StartupInfo.cb = ctypes.sizeof(STARTUPINFOEXW)
         siex.lpAttributeList = ctypes.addressof(attr_list_buf)
         creation_flags |= EXTENDED_STARTUPINFO_PRESENT
 
-        print("[*] Machine type override: 0x%04x" % MACHINE_TYPE[target_arch])
-
-        if not k32.CreateProcessW(
-            host_exe, None, None, None, False, creation_flags,
-            None, None, ctypes.byref(siex), ctypes.byref(pi)
-        ):
-            k32.DeleteProcThreadAttributeList(attr_list_buf)
-            raise OSError("CreateProcessW failed: %d" % k32.GetLastError())
+        _info(verbose, "Machine type override: 0x%04x" % MACHINE_TYPE[target_arch])
+        startup_info = ctypes.byref(siex)
     else:
         si = STARTUPINFOW()
         si.cb = ctypes.sizeof(STARTUPINFOW)
-
-        if not k32.CreateProcessW(host_exe, None, None, None, False, creation_flags, None, None, ctypes.byref(si), ctypes.byref(pi)):
-            raise OSError("CreateProcessW failed: %d" % k32.GetLastError())
+        startup_info = ctypes.byref(si)
+
+    # No existence probe beforehand: CreateProcessW reports a missing host image.
+    if not k32.CreateProcessW(
+        host_exe, None, None, None, False, creation_flags,
+        None, None, startup_info, ctypes.byref(pi)
+    ):
+        err = ctypes.get_last_error()
+        if attr_list_buf is not None:
+            k32.DeleteProcThreadAttributeList(attr_list_buf)
+        if err in (ERROR_FILE_NOT_FOUND, ERROR_PATH_NOT_FOUND):
+            raise OSError("No suitable host process for %s" % target_arch)
+        raise OSError("CreateProcessW failed: %d" % err)
 
     print("[+] Created process PID: %d" % pi.dwProcessId)
 
     try:
         remote_mem = k32.VirtualAllocEx(pi.hProcess, None, len(shellcode), MEM_COMMIT_RESERVE, PAGE_EXECUTE_READWRITE)
         if not remote_mem:
-            raise OSError("VirtualAllocEx failed: %d" % k32.GetLastError())
+            raise OSError("VirtualAllocEx failed: %d" % ctypes.get_last_error())
 
-        print("[+] Remote memory: 0x%x" % remote_mem)
+        _info(verbose, "Remote memory: 0x%x" % remote_mem)
+        start_addr = ctypes.c_void_p(remote_mem)
 
         written = ctypes.c_size_t()
-        if not k32.WriteProcessMemory(pi.hProcess, remote_mem, shellcode, len(shellcode), ctypes.byref(written)):
-            raise OSError("WriteProcessMemory failed: %d" % k32.GetLastError())
+        if not k32.WriteProcessMemory(pi.hProcess, start_addr, shellcode, len(shellcode), ctypes.byref(written)):
+            raise OSError("WriteProcessMemory failed: %d" % ctypes.get_last_error())
 
-        print("[+] Written: %d bytes" % written.value)
-        print("[+] Entry: 0x%x" % remote_mem)
-        print("[*] Executing...")
+        _info(verbose, "Written: %d bytes" % written.value)
+        _info(verbose, "Entry: 0x%x" % remote_mem)
+        _info(verbose, "Executing...")
         sys.stdout.flush()
 
-        remote_thread = k32.CreateRemoteThread(pi.hProcess, None, 0, remote_mem, None, 0, None)
+        remote_thread = k32.CreateRemoteThread(pi.hProcess, None, 0, start_addr, None, 0, None)
         if not remote_thread:
-            raise OSError("CreateRemoteThread failed: %d" % k32.GetLastError())
+            raise OSError("CreateRemoteThread failed: %d" % ctypes.get_last_error())
 
         k32.WaitForSingleObject(remote_thread, INFINITE)
 
@@ -320,35 +383,49 @@ def run_injected(shellcode, target_arch, cross_family=False):
 # Entry Point
 # =============================================================================
 
-def main():
-    parser = argparse.ArgumentParser(description='PIC Shellcode Loader')
-    parser.add_argument('--arch', choices=list(ARCH.keys()), required=True,
-                        help='Target architecture')
-    parser.add_argument('shellcode', help='Path to shellcode .bin file')
-    args = parser.parse_args()
+def run(path, arch, *, verbose=False):
+    """Load and execute the shellcode at path for arch; returns its exit code.
 
+    Importable counterpart of main() for harnesses that run many shots in one
+    interpreter: host detection and kernel32 setup are paid only once.
+    verbose enables the informational [*] lines. Raises ValueError when the
+    host cannot run arch, and OSError when loading or execution fails.
+    """
     host_os, host_family, host_bits = get_host()
-    python_bits = struct.calcsize("P") * 8
+    python_bits = ctypes.sizeof(ctypes.c_void_p) * 8
 
-    print("[*] Host: %s/%s/%dbit" % (host_os, host_family, host_bits))
-    print("[*] Python: %dbit" % python_bits)
+    _info(verbose, "Host: %s/%s/%dbit" % (host_os, host_family, host_bits))
+    _info(verbose, "Python: %dbit" % python_bits)
 
-    target = ARCH[args.arch]
-    print("[*] Target: %s" % args.arch)
-
-    with open(args.shellcode, 'rb') as f:
-        shellcode = f.read()
-    print("[+] Loaded: %d bytes" % len(shellcode))
+    target = ARCH[arch]
+    _info(verbose, "Target: %s" % arch)
 
     if host_os == 'windows':
+        shellcode = load_shellcode(path)
+        print("[+] Loaded: %d bytes" % len(shellcode))
         cross_family = host_family != target['family']
-        code = run_injected(shellcode, args.arch, cross_family=cross_family)
-    elif target['family'] != host_family or target['bits'] != host_bits:
-        sys.exit("[-] Cannot load %s shellcode on %s/%dbit host" % (args.arch, host_family, host_bits))
-    else:
-        code = run_mmap(shellcode)
+        return run_injected(shellcode, arch, cross_family=cross_family, verbose=verbose)
+    if (target['family'], target['bits']) != (host_family, host_bits):
+        raise ValueError("Cannot load %s shellcode on %s/%dbit host" % (arch, host_family, host_bits))
+    return run_mmap(path, verbose=verbose)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PIC Shellcode Loader')
+    parser.add_argument('--arch', choices=list(ARCH.keys()), required=True,
+                        help='Target architecture')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Print informational [*] lines')
+    parser.add_argument('shellcode', help='Path to shellcode .bin file')
+    args = parser.parse_args()
+
+    try:
+        code = run(args.shellcode, args.arch, verbose=args.verbose)
+    except (OSError, ValueError) as e:
+        sys.exit("[-] %s" % e)
 
     print("[+] Exit: %d" % code)
+    sys.stdout.flush()  # os._exit skips stdio teardown
     os._exit(code)
 
 